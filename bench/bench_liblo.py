@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# pyliblo - Python bindings for the liblo OSC library
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+
+"""
+Benchmarks for pyliblo's message encoding, sending, receiving and dispatch.
+
+Results are printed as JSON, and can be saved with --output and compared
+against an earlier run with --compare.
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import liblo
+
+try:
+    from time import perf_counter as clock
+except ImportError:
+    from timeit import default_timer as clock
+
+
+benchmarks = []
+
+def benchmark(f):
+    benchmarks.append(f)
+    return f
+
+
+def throughput(func, n, repeat):
+    """
+    Call func(n) repeat times, and return the best rate in operations per
+    second.
+    """
+    best = None
+    for i in range(repeat):
+        t1 = clock()
+        func(n)
+        t = clock() - t1
+        if best is None or t < best:
+            best = t
+    return {'n': n, 'ops_per_sec': n / best}
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    def p(q):
+        return samples[min(int(q * len(samples)), len(samples) - 1)] * 1e6
+    return {
+        'n': len(samples),
+        'p50_us': p(0.50),
+        'p90_us': p(0.90),
+        'p99_us': p(0.99),
+        'max_us': samples[-1] * 1e6,
+    }
+
+
+# message and bundle construction
+
+@benchmark
+def message_auto(opts):
+    def run(n):
+        for i in range(n):
+            liblo.Message('/foo', 123, 456.789, 'blubb')
+    return throughput(run, opts.n, opts.repeat)
+
+@benchmark
+def message_explicit(opts):
+    def run(n):
+        for i in range(n):
+            liblo.Message('/foo', ('i', 123), ('f', 456.789), ('s', 'blubb'))
+    return throughput(run, opts.n, opts.repeat)
+
+@benchmark
+def message_blob_64k(opts):
+    blob = b'\x2a' * 65536
+    def run(n):
+        for i in range(n):
+            liblo.Message('/foo', ('b', blob))
+    return throughput(run, opts.n // 100, opts.repeat)
+
+@benchmark
+def bundle_10(opts):
+    messages = [liblo.Message('/foo', i) for i in range(10)]
+    def run(n):
+        for i in range(n):
+            liblo.Bundle(*messages)
+    return throughput(run, opts.n, opts.repeat)
+
+
+# sending
+
+def send_benchmark(opts, make_target):
+    # messages are sent to a server that never reads them, the kernel simply
+    # discards them once the socket buffer is full
+    sink = liblo.Server()
+    target = make_target(sink.port)
+    message = liblo.Message('/foo', 123)
+    def run(n):
+        for i in range(n):
+            liblo.send(target, message)
+    try:
+        return throughput(run, opts.n, opts.repeat)
+    finally:
+        sink.free()
+
+@benchmark
+def send_int(opts):
+    return send_benchmark(opts, lambda port: port)
+
+@benchmark
+def send_tuple(opts):
+    return send_benchmark(opts, lambda port: ('localhost', port))
+
+@benchmark
+def send_url(opts):
+    return send_benchmark(opts, lambda port: 'osc.udp://localhost:%d/' % port)
+
+@benchmark
+def send_address(opts):
+    return send_benchmark(opts, lambda port: liblo.Address(port))
+
+
+# receiving and dispatching
+
+def recv_benchmark(opts, nmethods):
+    server = liblo.Server()
+    def callback(path, args):
+        pass
+    for i in range(nmethods):
+        server.add_method('/foo/%d' % i, 'i', callback)
+    target = liblo.Address(server.port)
+    # the last method registered is the last one liblo tries
+    message = liblo.Message('/foo/%d' % (nmethods - 1), 123)
+    # stay well below the socket's receive buffer size
+    chunk = 100
+
+    def run(n):
+        elapsed = 0.0
+        for i in range(0, n, chunk):
+            for j in range(chunk):
+                liblo.send(target, message)
+            t1 = clock()
+            for j in range(chunk):
+                if not server.recv(0):
+                    raise RuntimeError("message lost")
+            elapsed += clock() - t1
+        return elapsed
+
+    n = max(opts.n // 10, chunk)
+    best = None
+    try:
+        for i in range(opts.repeat):
+            t = run(n)
+            if best is None or t < best:
+                best = t
+    finally:
+        server.free()
+    return {'n': n, 'ops_per_sec': n / best}
+
+@benchmark
+def recv_1_method(opts):
+    return recv_benchmark(opts, 1)
+
+@benchmark
+def recv_1000_methods(opts):
+    return recv_benchmark(opts, 1000)
+
+
+# end-to-end latency
+
+def latency_benchmark(opts, port, proto):
+    server = liblo.ServerThread(port, proto)
+    received = threading.Event()
+    samples = []
+    def callback(path, args):
+        samples.append(clock() - args[0])
+        received.set()
+    server.add_method('/ping', 'd', callback)
+    server.start()
+    try:
+        target = liblo.Address(server.url)
+        for i in range(max(opts.n // 10, 1)):
+            received.clear()
+            liblo.send(target, '/ping', ('d', clock()))
+            if not received.wait(1.0):
+                raise RuntimeError("message lost")
+    finally:
+        server.stop()
+        server.free()
+    return percentiles(samples)
+
+@benchmark
+def latency_udp(opts):
+    return latency_benchmark(opts, None, liblo.UDP)
+
+@benchmark
+def latency_tcp(opts):
+    return latency_benchmark(opts, None, liblo.TCP)
+
+@benchmark
+def latency_unix(opts):
+    d = tempfile.mkdtemp()
+    try:
+        return latency_benchmark(opts, os.path.join(d, 'socket'), liblo.UNIX)
+    finally:
+        shutil.rmtree(d)
+
+
+def compare(old, new):
+    """
+    Print a table comparing two sets of results.
+    """
+    for name in sorted(set(old['results']) & set(new['results'])):
+        a = old['results'][name]
+        b = new['results'][name]
+        if 'ops_per_sec' in a:
+            key = 'ops_per_sec'
+            change = b[key] / a[key] - 1.0
+        else:
+            # lower latency is better, so report the change in speed
+            key = 'p50_us'
+            change = a[key] / b[key] - 1.0
+        print("%-20s %14.1f %14.1f %+8.1f%%  %s" % (
+                name, a[key], b[key], change * 100.0, key), file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('names', nargs='*',
+                        help="benchmarks to run (default: all)")
+    parser.add_argument('-n', type=int, default=10000,
+                        help="number of operations per benchmark")
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help="number of repetitions, the best one is reported")
+    parser.add_argument('-o', '--output',
+                        help="save results as JSON to this file")
+    parser.add_argument('-c', '--compare',
+                        help="compare results to an earlier JSON file")
+    parser.add_argument('-l', '--list', action='store_true',
+                        help="list available benchmarks")
+    opts = parser.parse_args()
+    if opts.n < 100:
+        parser.error("-n must be at least 100")
+
+    if opts.list:
+        for f in benchmarks:
+            print(f.__name__)
+        return
+
+    unknown = set(opts.names) - set(f.__name__ for f in benchmarks)
+    if unknown:
+        parser.error("unknown benchmark: %s" % ', '.join(sorted(unknown)))
+
+    selected = [f for f in benchmarks
+                if not opts.names or f.__name__ in opts.names]
+
+    results = {}
+    for f in selected:
+        print("running %s..." % f.__name__, file=sys.stderr)
+        results[f.__name__] = f(opts)
+
+    report = {
+        'pyliblo': liblo.__version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'n': opts.n,
+        'results': results,
+    }
+
+    s = json.dumps(report, indent=2, sort_keys=True)
+    print(s)
+    if opts.output:
+        with open(opts.output, 'w') as f:
+            f.write(s + '\n')
+
+    if opts.compare:
+        with open(opts.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
@@ -54,12 +54,14 @@ cdef extern from 'lo/lo.h':
 
     # server
     lo_server lo_server_new_with_proto(char *port, int proto, lo_err_handler err_h)
+    lo_server lo_server_new_multicast_iface(char *group, char *port, char *iface, char *ip, lo_err_handler err_h)
     void lo_server_free(lo_server s)
     char *lo_server_get_url(lo_server s)
     int lo_server_get_port(lo_server s)
     int lo_server_get_protocol(lo_server s)
     lo_method lo_server_add_method(lo_server s, char *path, char *typespec, lo_method_handler h, void *user_data)
     void lo_server_del_method(lo_server s, char *path, char *typespec)
+    int lo_server_del_lo_method(lo_server s, lo_method m)
     int lo_server_add_bundle_handlers(lo_server s, lo_bundle_start_handler sh, lo_bundle_end_handler eh, void *user_data)
     int lo_server_recv(lo_server s) nogil
     int lo_server_recv_noblock(lo_server s, int timeout) nogil
@@ -67,6 +69,7 @@ cdef extern from 'lo/lo.h':
 
     # server thread
     lo_server_thread lo_server_thread_new_with_proto(char *port, int proto, lo_err_handler err_h)
+    lo_server_thread lo_server_thread_new_multicast_iface(char *group, char *port, char *iface, char *ip, lo_err_handler err_h)
     void lo_server_thread_free(lo_server_thread st)
     lo_server lo_server_thread_get_server(lo_server_thread st)
     void lo_server_thread_start(lo_server_thread st)
@@ -82,6 +85,10 @@ cdef extern from 'lo/lo.h':
     char *lo_address_get_port(lo_address a)
     int lo_address_get_protocol(lo_address a)
     const_char* lo_address_errstr(lo_address a)
+    void lo_address_set_ttl(lo_address t, int ttl)
+    int lo_address_get_ttl(lo_address t)
+    int lo_address_set_iface(lo_address t, char *iface, char *ip)
+    const_char* lo_address_get_iface(lo_address t)
 
     # message
     lo_message lo_message_new()
@@ -101,6 +108,12 @@ cdef extern from 'lo/lo.h':
     void lo_message_add_timetag(lo_message m, lo_timetag a)
     void lo_message_add_blob(lo_message m, lo_blob a)
     lo_address lo_message_get_source(lo_message m)
+    char *lo_message_get_types(lo_message m)
+    int lo_message_get_argc(lo_message m)
+    lo_arg **lo_message_get_argv(lo_message m)
+    lo_timetag lo_message_get_timestamp(lo_message m)
+    void *lo_message_serialise(lo_message m, char *path, void *to, size_t *size)
+    lo_message lo_message_deserialise(void *data, size_t size, int *result)
 
     # blob
     lo_blob lo_blob_new(int32_t size, void *data)
@@ -115,3 +128,6 @@ cdef extern from 'lo/lo.h':
 
     # timetag
     void lo_timetag_now(lo_timetag *t)
+
+    # pattern matching
+    int lo_pattern_match(char *str, char *p)
@@ -15,6 +15,10 @@ __version__ = '0.10.0'
 from cpython cimport PY_VERSION_HEX
 cdef extern from 'Python.h':
     void PyEval_InitThreads()
+cdef extern from 'sys/socket.h':
+    ssize_t recv(int sockfd, void *buf, size_t len, int flags)
+    int MSG_PEEK
+    int MSG_DONTWAIT
 
 from libc.stdlib cimport malloc, free
 from libc.math cimport modf
@@ -25,6 +29,23 @@ from liblo cimport *
 import inspect as _inspect
 import functools as _functools
 import weakref as _weakref
+import struct as _struct
+import array as _array
+import bisect as _bisect
+import heapq as _heapq
+import mmap as _mmap
+import tempfile as _tempfile
+import zlib as _zlib
+import os as _os
+import sys as _sys
+import socket as _socket
+import traceback as _traceback
+import collections as _collections
+
+try:
+    from time import perf_counter as _clock
+except ImportError:
+    from time import time as _clock
 
 
 class _weakref_method:
@@ -206,8 +227,8 @@ class ServerError(Exception):
         return s
 
 
-cdef int _msg_callback(const_char *path, const_char *types, lo_arg **argv,
-                       int argc, lo_message msg, void *cb_data) with gil:
+cdef list _decode_args(const_char *types, lo_arg **argv, int argc):
+    # convert OSC arguments to the corresponding python objects
     cdef int i
     cdef char t
     cdef unsigned char *ptr
@@ -245,11 +266,153 @@ cdef int _msg_callback(const_char *path, const_char *types, lo_arg **argv,
 
         args.append(v)
 
+    return args
+
+
+cdef class _Profiler:
+    # per-path timing statistics, shared by all callbacks of one server
+    cdef bint enabled
+    cdef object hook
+    cdef dict stats
+
+    def __init__(self):
+        self.enabled = False
+        self.hook = None
+        self.stats = {}
+
+    cdef _add(self, path, dict timings):
+        stats = self.stats.get(path)
+        if stats is None:
+            stats = self.stats[path] = {}
+        for stage, t in timings.items():
+            s = stats.get(stage)
+            if s is None:
+                stats[stage] = [1, t, t]
+            else:
+                s[0] += 1
+                s[1] += t
+                if t > s[2]:
+                    s[2] = t
+        if self.hook is not None:
+            self.hook(path, timings)
+
+
+cdef bint _data_waiting(int fd):
+    # check if a datagram is waiting on the socket, without removing it
+    cdef char c
+    if fd < 0:
+        return False
+    return recv(fd, &c, 1, MSG_PEEK | MSG_DONTWAIT) >= 0
+
+
+cdef _call_deferred(cb, tuple func_args):
+    cdef double t0, t1
+    cdef _Profiler profiler = cb.profiler
+    cdef bint profiling = profiler.enabled
+    try:
+        if profiling: t0 = _clock()
+        func = cb.func.func
+        if profiling: t1 = _clock()
+        func(*func_args[:cb.nargs])
+        if profiling:
+            profiler._add(func_args[0], {
+                'resolve': t1 - t0,
+                'handler': _clock() - t1,
+            })
+    except Exception:
+        # like exceptions in regular callbacks, print and ignore them
+        _traceback.print_exc()
+
+
+# maximum number of packets Server.recv() receives while waiting for the
+# socket to be empty, before dispatching coalesced messages anyway
+_COALESCE_MAX_DRAIN = 1000
+
+
+cdef class _Coalescer:
+    # latest pending message per key, shared by all callbacks of one server.
+    # messages are held back while more datagrams are waiting on the socket,
+    # and dispatched by whichever callback finds the socket empty
+    cdef int fd
+    cdef lo_method method
+    cdef object pending
+    cdef long count
+
+    def __init__(self):
+        self.fd = -1
+        self.method = NULL
+        self.pending = _collections.OrderedDict()
+        self.count = 0
+
+    cdef _add(self, cb, tuple func_args):
+        if cb.coalesce_by_src:
+            key = (cb, func_args[0], func_args[3].url)
+        else:
+            key = (cb, func_args[0])
+        if key in self.pending:
+            # drop the older message, and move the key to the end
+            del self.pending[key]
+            self.count += 1
+        self.pending[key] = func_args
+        self._flush_if_idle()
+
+    cdef _flush_if_idle(self):
+        if self.pending and not _data_waiting(self.fd):
+            self._flush()
+
+    cdef _flush(self):
+        while self.pending:
+            key, func_args = self.pending.popitem(last=False)
+            _call_deferred(key[0], func_args)
+
+    cdef _discard(self, path, typespec):
+        # drop pending messages of methods removed by del_method(), using
+        # the same matching rules as liblo
+        for key in list(self.pending):
+            cb = key[0]
+            if cb.typespec != typespec:
+                continue
+            if (cb.path == path or
+                    (path is not None and cb.path is not None and
+                     lo_pattern_match(cb.path, path))):
+                del self.pending[key]
+
+
+cdef int _coalesce_callback(const_char *path, const_char *types,
+                            lo_arg **argv, int argc, lo_message msg,
+                            void *cb_data) with gil:
+    # called for every message that isn't handled by a method registered
+    # before this one, so held back messages are dispatched even if the
+    # last message waiting isn't handled at all
+    (<_Coalescer>cb_data)._flush_if_idle()
+    # let liblo continue looking for a method that handles the message
+    return 1
+
+
+cdef int _msg_callback(const_char *path, const_char *types, lo_arg **argv,
+                       int argc, lo_message msg, void *cb_data) with gil:
+    cdef double t0, t1, t2, t3
+
+    cb = <object>cb_data
+    cdef _Profiler profiler = cb.profiler
+    cdef bint profiling = profiler.enabled
+
+    if not cb.coalesce:
+        # dispatch older messages held back for coalescing first, if this is
+        # the last message waiting
+        (<_Coalescer>cb.coalescer)._flush_if_idle()
+
+    if profiling: t0 = _clock()
+
+    args = _decode_args(types, argv, argc)
+
+    if profiling: t1 = _clock()
+
     cdef char *url = lo_address_get_url(lo_message_get_source(msg))
     src = Address(url)
     free(url)
 
-    cb = <object>cb_data
+    if profiling: t2 = _clock()
 
     func_args = (_decode(<char*>path),
                  args,
@@ -257,12 +420,56 @@ cdef int _msg_callback(const_char *path, const_char *types, lo_arg **argv,
                  src,
                  cb.user_data)
 
+    if cb.coalesce:
+        if profiling:
+            profiler._add(func_args[0], {
+                'decode': t1 - t0,
+                'source': t2 - t1,
+            })
+        (<_Coalescer>cb.coalescer)._add(cb, func_args)
+        return 0
+
+    # resolve the weak reference to the callback function
+    func = cb.func.func
+
+    if profiling: t3 = _clock()
+
     # call the function
-    r = cb.func(*func_args[:cb.nargs])
+    r = func(*func_args[:cb.nargs])
+
+    if profiling:
+        profiler._add(func_args[0], {
+            'decode': t1 - t0,
+            'source': t2 - t1,
+            'resolve': t3 - t2,
+            'handler': _clock() - t3,
+        })
 
     return r if r is not None else 0
 
 
+cdef int _batch_callback(const_char *path, const_char *types, lo_arg **argv,
+                         int argc, lo_message msg, void *cb_data) with gil:
+    cdef lo_timetag tt
+
+    records = <object>cb_data
+
+    args = _decode_args(types, argv, argc)
+
+    cdef char *url = lo_address_get_url(lo_message_get_source(msg))
+    src = Address(url)
+    free(url)
+
+    # messages that are not part of a bundle have an "immediate" timetag
+    tt = lo_message_get_timestamp(msg)
+    timetag = (None if tt.sec == 0 and tt.frac <= 1
+               else _timetag_to_double(tt))
+
+    records.append((_decode(<char*>path), _decode(<char*>types),
+                    args, src, timetag))
+    return 0
+
+
 cdef int _callback_num_args(func):
     """
     Return the number of arguments that should be passed to callback *func*.
@@ -294,14 +501,24 @@ cdef int _callback_num_args(func):
 
 
 cdef int _bundle_start_callback(lo_timetag t, void *cb_data) with gil:
+    cdef double t0
     cb = <object>cb_data
+    cdef _Profiler profiler = cb.profiler
+    cdef bint profiling = profiler.enabled
+    if profiling: t0 = _clock()
     r = cb.start_func(_timetag_to_double(t), cb.user_data)
+    if profiling: profiler._add(None, {'bundle_start': _clock() - t0})
     return r if r is not None else 0
 
 
 cdef int _bundle_end_callback(void *cb_data) with gil:
+    cdef double t0
     cb = <object>cb_data
+    cdef _Profiler profiler = cb.profiler
+    cdef bint profiling = profiler.enabled
+    if profiling: t0 = _clock()
     r = cb.end_func(cb.user_data)
+    if profiling: profiler._add(None, {'bundle_end': _clock() - t0})
     return r if r is not None else 0
 
 
@@ -313,6 +530,62 @@ cdef void _err_handler(int num, const_char *msg, const_char *where) with gil:
     if where: __exception.where = <char*>where
 
 
+cdef void *_new_server(port, int proto, dict kwargs, bint thread) except *:
+    # create a lo_server, or a lo_server_thread if thread is true, and join
+    # the multicast group given in kwargs (if any)
+    cdef char *cs
+    cdef char *cg
+    cdef char *ci
+    cdef char *cip
+    cdef void *r
+
+    if port is not None:
+        p = _encode(str(port))
+        cs = p
+    else:
+        cs = NULL
+
+    group = kwargs.pop('group', None)
+    iface = kwargs.pop('iface', None)
+    ip = kwargs.pop('ip', None)
+
+    if group is None:
+        if iface is not None or ip is not None:
+            raise ValueError("iface and ip require a multicast group")
+        if thread:
+            r = lo_server_thread_new_with_proto(cs, proto, _err_handler)
+        else:
+            r = lo_server_new_with_proto(cs, proto, _err_handler)
+        if r == NULL and __exception is None:
+            raise ServerError(0, "could not create server", None)
+        return r
+
+    if proto not in (LO_DEFAULT, LO_UDP):
+        raise ValueError("multicast is only supported over UDP")
+    g = _encode(group)
+    cg = g
+    if iface is not None:
+        i = _encode(iface)
+        ci = i
+    else:
+        ci = NULL
+    if ip is not None:
+        a = _encode(ip)
+        cip = a
+    else:
+        cip = NULL
+
+    if thread:
+        r = lo_server_thread_new_multicast_iface(cg, cs, ci, cip,
+                                                 _err_handler)
+    else:
+        r = lo_server_new_multicast_iface(cg, cs, ci, cip, _err_handler)
+    # liblo doesn't call the error handler if the interface can't be found
+    if r == NULL and __exception is None:
+        raise ServerError(0, "could not join multicast group", None)
+    return r
+
+
 # decorator to register callbacks
 
 class make_method:
@@ -324,9 +597,10 @@ class make_method:
     # defined
     _counter = 0
 
-    def __init__(self, path, types, user_data=None):
+    def __init__(self, path, types, user_data=None, coalesce=False,
+                 coalesce_by_src=False):
         """
-        make_method(path, typespec[, user_data])
+        make_method(path, typespec[, user_data, coalesce, coalesce_by_src])
 
         Set the path and argument types for which the decorated method
         is to be registered.
@@ -340,11 +614,18 @@ class make_method:
         :param user_data:
             An arbitrary object that will be passed on to the decorated
             method every time a matching message is received.
+        :param coalesce:
+            only dispatch the most recent of several queued messages, see
+            :meth:`Server.add_method()`.
+        :param coalesce_by_src:
+            coalesce messages separately for each source address.
         """
         self.spec = struct(counter=make_method._counter,
                            path=path,
                            types=types,
-                           user_data=user_data)
+                           user_data=user_data,
+                           coalesce=coalesce,
+                           coalesce_by_src=coalesce_by_src)
         make_method._counter += 1
 
     def __call__(self, f):
@@ -357,14 +638,48 @@ class make_method:
         return f
 
 
+def _find_methods(obj):
+    """
+    Return the names and specs of all members of *obj* that are decorated
+    with make_method, in the order in which they were defined.
+    """
+    methods = []
+    for name, m in _inspect.getmembers(obj):
+        for spec in getattr(m, '_method_spec', ()):
+            methods.append(struct(name=name, spec=spec, nargs=-1))
+    # sort by counter
+    methods.sort(key=lambda x: x.spec.counter)
+    return methods
+
+
+# decorated methods of each class, with the number of arguments filled in
+# when an instance is first registered
+_method_registry = _weakref.WeakKeyDictionary()
+
+def _class_methods(cls):
+    try:
+        return _method_registry[cls]
+    except KeyError:
+        # looking up members on the class (rather than an instance) avoids
+        # evaluating properties
+        methods = _method_registry[cls] = _find_methods(cls)
+        return methods
+
+
 # common base class for both Server and ServerThread
 
 cdef class _ServerBase:
     cdef lo_server _server
     cdef list _keep_refs
+    cdef _Profiler _profiler
+    cdef _Coalescer _coalescer
 
     def __init__(self, **kwargs):
         self._keep_refs = []
+        self._profiler = _Profiler()
+        self._coalescer = _Coalescer()
+        if self._server:
+            self._coalescer.fd = lo_server_get_socket_fd(self._server)
 
         if 'reg_methods' not in kwargs or kwargs['reg_methods']:
             self.register_methods()
@@ -386,19 +701,24 @@ cdef class _ServerBase:
 
         This function is usually called automatically by the server's
         constructor, unless its *reg_methods* parameter was set to ``False``.
+
+        Decorated methods are looked up once per class, and the result is
+        cached.  Methods added to a class after one of its instances has
+        been registered will not be found.
         """
         if obj is None:
             obj = self
-        # find and register methods that were defined using decorators
-        methods = []
-        for m in _inspect.getmembers(obj):
-            if hasattr(m[1], '_method_spec'):
-                for spec in m[1]._method_spec:
-                    methods.append(struct(spec=spec, name=m[1]))
-        # sort by counter
-        methods.sort(key=lambda x: x.spec.counter)
+        if _inspect.isclass(obj) or _inspect.ismodule(obj):
+            methods = _find_methods(obj)
+        else:
+            methods = _class_methods(obj.__class__)
         for e in methods:
-            self.add_method(e.spec.path, e.spec.types, e.name, e.spec.user_data)
+            func = getattr(obj, e.name)
+            if e.nargs < 0:
+                e.nargs = _callback_num_args(func)
+            self._add_method(e.spec.path, e.spec.types, func,
+                             e.spec.user_data, e.nargs, e.spec.coalesce,
+                             e.spec.coalesce_by_src)
 
     def get_url(self):
         self._check()
@@ -423,9 +743,10 @@ cdef class _ServerBase:
         self._check()
         return lo_server_get_socket_fd(self._server)
 
-    def add_method(self, path, typespec, func, user_data=None):
+    def add_method(self, path, typespec, func, user_data=None,
+                   coalesce=False, coalesce_by_src=False):
         """
-        add_method(path, typespec, func, user_data=None)
+        add_method(path, typespec, func, user_data=None, coalesce=False, coalesce_by_src=False)
 
         Register a callback function for OSC messages with matching path and
         argument types.
@@ -446,7 +767,29 @@ cdef class _ServerBase:
         :param user_data:
             An arbitrary object that will be passed on to *func* every time
             a matching message is received.
+
+        :param coalesce:
+            if ``True``, messages are held back while more messages are
+            waiting to be received, and only the most recent one for each
+            path is dispatched once the server socket is empty.  Older ones
+            are dropped (see :attr:`coalesced`).  Useful for continuous
+            controls like faders, where only the latest value matters.
+            Held back messages may be dispatched after messages for other
+            methods that were received later.  Coalescing has no effect with
+            :const:`TCP`.  The return value of *func* is ignored.
+
+        :param coalesce_by_src:
+            if ``True``, messages are coalesced separately for each source
+            address.
+
+        .. versionchanged:: 0.11.0
+            Added the *coalesce* and *coalesce_by_src* parameters.
         """
+        self._add_method(path, typespec, func, user_data, -1, coalesce,
+                         coalesce_by_src)
+
+    cdef _add_method(self, path, typespec, func, user_data, int nargs,
+                     bint coalesce=False, bint coalesce_by_src=False):
         cdef char *p
         cdef char *t
 
@@ -468,21 +811,37 @@ cdef class _ServerBase:
 
         self._check()
 
-        # determine the number of arguments to call the function with
-        nargs = _callback_num_args(func)
+        if nargs < 0:
+            # determine the number of arguments to call the function with
+            nargs = _callback_num_args(func)
 
         # use a weak reference if func is a method, to avoid circular
         # references in cases where func is a method of an object that also
         # has a reference to the server (e.g. when deriving from the Server
         # class)
         cb = struct(func=_weakref_method(func),
+                    path=_encode(path) if path is not None else None,
+                    typespec=(_encode(typespec) if typespec is not None
+                              else None),
                     user_data=user_data,
-                    nargs=nargs)
+                    nargs=nargs,
+                    profiler=self._profiler,
+                    coalesce=coalesce or coalesce_by_src,
+                    coalesce_by_src=coalesce_by_src,
+                    coalescer=self._coalescer)
         # keep a reference to the callback data around
         self._keep_refs.append(cb)
 
+        if cb.coalesce and self._coalescer.method == NULL:
+            self._add_coalesce_method()
+
         lo_server_add_method(self._server, p, t, _msg_callback, <void*>cb)
 
+    cdef _add_coalesce_method(self):
+        self._coalescer.method = lo_server_add_method(
+            self._server, NULL, NULL, _coalesce_callback,
+            <void*>self._coalescer)
+
     def del_method(self, path, typespec):
         """
         del_method(path, typespec)
@@ -513,6 +872,12 @@ cdef class _ServerBase:
 
         self._check()
         lo_server_del_method(self._server, p, t)
+        if path is None and typespec is None and self._coalescer.method:
+            # the catch-all method used for coalescing was deleted as well
+            self._add_coalesce_method()
+        self._coalescer._discard(_encode(path) if path is not None else None,
+                                 (_encode(typespec) if typespec is not None
+                                  else None))
 
     def add_bundle_handlers(self, start_handler, end_handler, user_data=None):
         """
@@ -533,12 +898,113 @@ cdef class _ServerBase:
         """
         cb_data = struct(start_func=_weakref_method(start_handler),
                          end_func=_weakref_method(end_handler),
-                         user_data=user_data)
+                         user_data=user_data,
+                         profiler=self._profiler)
         self._keep_refs.append(cb_data)
 
         lo_server_add_bundle_handlers(self._server, _bundle_start_callback,
                                       _bundle_end_callback, <void*>cb_data)
 
+    def set_multicast_options(self, ttl=None, loopback=None):
+        """
+        set_multicast_options(ttl=None, loopback=None)
+
+        Set options for multicast messages sent from this server's socket,
+        i.e. using :meth:`send()`.  Only supported with :const:`UDP`.
+
+        :param ttl:
+            the number of hops multicast messages may travel.  The system
+            default of 1 restricts them to the local network.
+        :param loopback:
+            whether multicast messages are also delivered to receivers on
+            the local host (the system default is ``True``).
+
+        .. versionadded:: 0.11.0
+        """
+        self._check()
+        if lo_server_get_protocol(self._server) != LO_UDP:
+            raise ValueError("multicast is only supported over UDP")
+        # work on a duplicate of the file descriptor, so closing the socket
+        # object leaves the server's socket open
+        fd = lo_server_get_socket_fd(self._server)
+        if PY_VERSION_HEX >= 0x03070000:
+            # the address family is detected automatically
+            sock = _socket.socket(fileno=_os.dup(fd))
+        else:
+            sock = _socket.fromfd(fd, _socket.AF_INET, _socket.SOCK_DGRAM)
+        try:
+            if sock.family == _socket.AF_INET6:
+                level = _socket.IPPROTO_IPV6
+                ttl_option = _socket.IPV6_MULTICAST_HOPS
+                loop_option = _socket.IPV6_MULTICAST_LOOP
+            else:
+                level = _socket.IPPROTO_IP
+                ttl_option = _socket.IP_MULTICAST_TTL
+                loop_option = _socket.IP_MULTICAST_LOOP
+            if ttl is not None:
+                sock.setsockopt(level, ttl_option, ttl)
+            if loopback is not None:
+                sock.setsockopt(level, loop_option, 1 if loopback else 0)
+        finally:
+            sock.close()
+
+    def enable_profiling(self, hook=None):
+        """
+        enable_profiling(hook=None)
+
+        Start measuring the time spent dispatching incoming messages.
+        For each message path, the time spent in the following stages is
+        recorded: ``'decode'`` (converting arguments to Python objects),
+        ``'source'`` (creating the source :class:`Address`), ``'resolve'``
+        (looking up the callback function) and ``'handler'`` (running the
+        callback itself).  Bundle handlers are recorded under the path
+        ``None``, as ``'bundle_start'`` and ``'bundle_end'``.
+
+        :param hook:
+            an optional function that will be called as
+            ``hook(path, timings)`` after each message, *timings* being a
+            dict mapping stage names to durations in seconds.
+
+        .. versionadded:: 0.11.0
+        """
+        self._profiler.hook = hook
+        self._profiler.enabled = True
+
+    def disable_profiling(self):
+        """
+        Stop measuring dispatch times.  Statistics collected so far are kept
+        until :meth:`get_profile()` is called with *reset* set to ``True``.
+
+        .. versionadded:: 0.11.0
+        """
+        self._profiler.enabled = False
+        self._profiler.hook = None
+
+    def get_profile(self, reset=False):
+        """
+        get_profile(reset=False)
+
+        Return the statistics collected since profiling was enabled.
+
+        :param reset:
+            clear the statistics after returning them.
+
+        :return:
+            a dict mapping each message path to a dict of stages, with
+            ``'count'``, ``'total'`` and ``'max'`` values for each stage
+            (times in seconds).
+
+        .. versionadded:: 0.11.0
+        """
+        profile = {}
+        for path, stats in self._profiler.stats.items():
+            profile[path] = dict(
+                (stage, {'count': s[0], 'total': s[1], 'max': s[2]})
+                for stage, s in stats.items())
+        if reset:
+            self._profiler.stats = {}
+        return profile
+
     def send(self, target, *args):
         """
         send(target, *messages)
@@ -586,6 +1052,17 @@ cdef class _ServerBase:
         def __get__(self):
             return self.get_protocol()
 
+    property coalesced:
+        """
+        The number of messages that were dropped because a more recent
+        message for the same path was received, for methods registered
+        with *coalesce* set.
+
+        .. versionadded:: 0.11.0
+        """
+        def __get__(self):
+            return self._coalescer.count
+
 
 cdef class Server(_ServerBase):
     """
@@ -611,20 +1088,22 @@ cdef class Server(_ServerBase):
             ``False`` if you don't want the init function to automatically
             register callbacks defined with the :func:`make_method` decorator
             (keyword argument only).
+        :keyword group:
+            a multicast group address (e.g. ``'224.0.0.1'``) to join.
+            Only supported with :const:`UDP` (keyword argument only).
+        :keyword iface:
+            the name of the network interface on which to join the
+            multicast group.  Requires *group* (keyword argument only).
+        :keyword ip:
+            the IP address of the network interface on which to join the
+            multicast group, as an alternative to *iface*.  Requires *group*
+            (keyword argument only).
 
-        Exceptions: ServerError
+        Exceptions: ServerError, ValueError
         """
-        cdef char *cs
-
-        if port is not None:
-            p = _encode(str(port));
-            cs = p
-        else:
-            cs = NULL
-
         global __exception
         __exception = None
-        self._server = lo_server_new_with_proto(cs, proto, _err_handler)
+        self._server = _new_server(port, proto, kwargs, False)
         if __exception:
             raise __exception
 
@@ -641,6 +1120,8 @@ cdef class Server(_ServerBase):
         if self._server:
             lo_server_free(self._server)
             self._server = NULL
+        if self._coalescer is not None:
+            self._coalescer.pending.clear()
 
     def recv(self, timeout=None):
         """
@@ -657,6 +1138,10 @@ cdef class Server(_ServerBase):
 
         :return:
             ``True`` if a message was received, otherwise ``False``.
+
+        While messages are held back for coalescing (see
+        :meth:`add_method()`), all further messages that are already
+        waiting are received and dispatched as well.
         """
         cdef int t, r
         self._check()
@@ -664,11 +1149,92 @@ cdef class Server(_ServerBase):
             t = timeout
             with nogil:
                 r = lo_server_recv_noblock(self._server, t)
-            return r and True or False
         else:
             with nogil:
                 lo_server_recv(self._server)
-            return True
+            r = 1
+        if r:
+            self._drain()
+        return r and True or False
+
+    cdef _drain(self):
+        # receive messages until the socket is empty, which dispatches the
+        # messages held back for coalescing
+        cdef int r = 1
+        cdef int n = 0
+        while self._coalescer.pending and r and n < _COALESCE_MAX_DRAIN:
+            with nogil:
+                r = lo_server_recv_noblock(self._server, 0)
+            n += 1
+        # if messages keep arriving, stop waiting for the socket to be empty
+        self._coalescer._flush()
+
+    def recv_batch(self, max_n=1000, timeout=None):
+        """
+        recv_batch(max_n=1000, timeout=None)
+
+        Receive up to *max_n* messages, and return them instead of
+        dispatching them to callback functions.  Blocking by default, until
+        at least one message has been received, unless *timeout* is
+        specified.  Once a message has been received, all further messages
+        that are already waiting are returned without blocking.
+
+        Messages that match a method registered with :meth:`add_method()`
+        are still dispatched to that method, and not returned.
+
+        :param max_n:
+            the maximum number of messages to receive.  Bundles are always
+            received as a whole, so the limit may be exceeded by the number
+            of messages in the last bundle.  At most *max_n* packets are
+            read, including those dispatched to registered methods.
+        :param timeout:
+            Time in milliseconds after which the function returns if no
+            messages have been received.
+
+        :return:
+            a list of ``(path, types, args, src, timetag)`` tuples, with
+            the same values that would be passed to a callback function.
+            *timetag* is the bundle's timetag as a float, or ``None`` if
+            the message was not part of a bundle.
+
+        :raises ValueError:
+            if *max_n* is less than 1.
+
+        .. versionadded:: 0.11.0
+        """
+        cdef int t, r, n
+        cdef lo_method method
+        self._check()
+        if max_n < 1:
+            raise ValueError("max_n must be at least 1")
+
+        # liblo tries methods in the order they were added, so a catch-all
+        # method added for the duration of this call only receives messages
+        # that no other method handles
+        records = []
+        method = lo_server_add_method(self._server, NULL, NULL,
+                                      _batch_callback, <void*>records)
+        try:
+            if timeout is not None:
+                t = timeout
+                with nogil:
+                    r = lo_server_recv_noblock(self._server, t)
+            else:
+                with nogil:
+                    r = lo_server_recv(self._server)
+            # limit the number of packets as well, in case all of them are
+            # handled by other methods
+            n = 1
+            while r and len(records) < max_n and n < max_n:
+                with nogil:
+                    r = lo_server_recv_noblock(self._server, 0)
+                n += 1
+        finally:
+            lo_server_del_lo_method(self._server, method)
+        # dispatch messages that are still held back for coalescing
+        self._coalescer._flush()
+
+        return records
 
 
 cdef class ServerThread(_ServerBase):
@@ -705,25 +1271,28 @@ cdef class ServerThread(_ServerBase):
             ``False`` if you don't want the init function to automatically
             register callbacks defined with the make_method decorator
             (keyword argument only).
+        :keyword group:
+            a multicast group address to join, see :class:`Server`
+            (keyword argument only).
+        :keyword iface:
+            the network interface on which to join the multicast group.
+            Requires *group* (keyword argument only).
+        :keyword ip:
+            the IP address of the network interface on which to join the
+            multicast group.  Requires *group* (keyword argument only).
 
         :raises ServerError:
             if creating the server fails, e.g. because the given port could not
-            be opened.
+            be opened, or the multicast interface could not be found.
+        :raises ValueError:
+            if *iface* or *ip* is given without *group*.
         """
-        cdef char *cs
-
-        if port is not None:
-            p = _encode(str(port));
-            cs = p
-        else:
-            cs = NULL
-
         # make sure python can handle threading
         PyEval_InitThreads()
 
         global __exception
         __exception = None
-        self._server_thread = lo_server_thread_new_with_proto(cs, proto, _err_handler)
+        self._server_thread = _new_server(port, proto, kwargs, True)
         if __exception:
             raise __exception
         self._server = lo_server_thread_get_server(self._server_thread)
@@ -742,6 +1311,8 @@ cdef class ServerThread(_ServerBase):
             lo_server_thread_free(self._server_thread)
             self._server_thread = NULL
             self._server = NULL
+        if self._coalescer is not None:
+            self._coalescer.pending.clear()
 
     def start(self):
         """
@@ -842,6 +1413,43 @@ cdef class Address:
     def get_protocol(self):
         return lo_address_get_protocol(self._address)
 
+    def get_ttl(self):
+        return lo_address_get_ttl(self._address)
+
+    def set_ttl(self, ttl):
+        lo_address_set_ttl(self._address, ttl)
+
+    def get_iface(self):
+        cdef const_char *s = lo_address_get_iface(self._address)
+        return _decode(<char*>s) if s else None
+
+    def set_iface(self, iface=None, ip=None):
+        """
+        set_iface(iface=None, ip=None)
+
+        Select the network interface used for sending multicast messages to
+        this address, either by name or by IP address.
+
+        :raises AddressError:
+            if the interface could not be found.
+
+        .. versionadded:: 0.11.0
+        """
+        cdef char *ci
+        cdef char *cip
+        if iface is not None:
+            i = _encode(iface)
+            ci = i
+        else:
+            ci = NULL
+        if ip is not None:
+            a = _encode(ip)
+            cip = a
+        else:
+            cip = NULL
+        if lo_address_set_iface(self._address, ci, cip):
+            raise AddressError("invalid interface")
+
     property url:
         """
         The address's URL.
@@ -871,6 +1479,29 @@ cdef class Address:
         def __get__(self):
             return self.get_protocol()
 
+    property ttl:
+        """
+        The time-to-live of multicast messages sent to this address, or -1
+        to use the system default.
+
+        .. versionadded:: 0.11.0
+        """
+        def __get__(self):
+            return self.get_ttl()
+        def __set__(self, ttl):
+            self.set_ttl(ttl)
+
+    property iface:
+        """
+        The name of the network interface used for sending multicast
+        messages to this address, or ``None`` if not set.
+        See :meth:`set_iface()`.
+
+        .. versionadded:: 0.11.0
+        """
+        def __get__(self):
+            return self.get_iface()
+
 
 ################################################################################
 #  Message
@@ -1081,3 +1712,495 @@ cdef class Bundle:
             self._keep_refs.append(m)
             message = <Message> m
             lo_bundle_add_message(self._bundle, message._path, message._message)
+
+
+################################################################################
+#  Capture files
+################################################################################
+
+# A capture file starts with _CAPTURE_MAGIC, followed by one record per
+# message: a header (_CAPTURE_RECORD), the source URL, and the serialised
+# OSC message.  All header fields are in network byte order, like OSC itself.
+_CAPTURE_MAGIC = b'PYLOCAP1'
+_CAPTURE_RECORD = _struct.Struct('>IdH')    # message size, timestamp, URL size
+
+# The index is a cache stored next to the capture file.  It records how much
+# of the capture it covers, so messages appended later are added to it
+# without parsing the whole capture again.  If the indexed part of the
+# capture was modified, or the index can't be read, it is rebuilt.  The index
+# is memory-mapped, so its arrays are stored in native byte order, and start
+# at a multiple of 8 bytes.
+_INDEX_MAGIC = b'PYLOIDX3'
+# capture size, capture mtime, indexed size, checksum, records, paths,
+# sources, timestamps sorted, little-endian
+_INDEX_HEADER = _struct.Struct('<QdQIIIIBB')
+_INDEX_STRING = _struct.Struct('<H')
+# number of bytes at the start and at the end of the indexed part of the
+# capture that are checksummed to detect modifications
+_INDEX_CHECK_SIZE = 4096
+
+
+cdef bytes _serialise_message(Message message):
+    cdef size_t size
+    cdef void *data = lo_message_serialise(message._message, message._path,
+                                           NULL, &size)
+    if data == NULL:
+        raise MemoryError()
+    try:
+        return (<char*>data)[:size]
+    finally:
+        free(data)
+
+
+cdef tuple _deserialise_message(bytes data):
+    cdef int result
+    cdef char *p = data
+    cdef lo_message msg = lo_message_deserialise(p, len(data), &result)
+    if msg == NULL:
+        raise ValueError("invalid OSC message (error %d)" % result)
+    try:
+        types = lo_message_get_types(msg)
+        args = _decode_args(types, lo_message_get_argv(msg),
+                            lo_message_get_argc(msg))
+        return _decode(p), _decode(types), args
+    finally:
+        lo_message_free(msg)
+
+
+class CaptureWriter:
+    """
+    Writes OSC messages to a capture file, which can later be read using
+    :class:`CaptureReader`.
+
+    A :class:`!CaptureWriter` is also a valid callback function, so all
+    messages received by a server can be recorded using::
+
+        server.add_method(None, None, CaptureWriter('session.cap'))
+
+    .. versionadded:: 0.11.0
+    """
+    def __init__(self, filename, append=False):
+        """
+        CaptureWriter(filename, append=False)
+
+        Create a new capture file, or append to an existing one.
+        """
+        self._file = open(filename, 'ab' if append else 'wb')
+        if self._file.tell() == 0:
+            self._file.write(_CAPTURE_MAGIC)
+
+    def write(self, message, src=None, timestamp=None):
+        """
+        write(message, src=None, timestamp=None)
+
+        Append a message to the capture file.
+
+        :param message:
+            the :class:`Message` to be written.
+        :param src:
+            the :class:`Address` or URL the message was received from.
+        :param timestamp:
+            the time at which the message was received, as an OSC timetag
+            float.  Defaults to the current time.
+        """
+        if timestamp is None:
+            timestamp = time()
+        if isinstance(src, Address):
+            src = src.url
+        url = _encode(src) if src else b''
+        data = _serialise_message(message)
+        self._file.write(_CAPTURE_RECORD.pack(len(data), timestamp, len(url)))
+        self._file.write(url)
+        self._file.write(data)
+
+    def __call__(self, path, args, types, src):
+        self.write(Message(path, *zip(types, args)), src)
+
+    def flush(self):
+        """
+        Flush buffered records to disk.
+        """
+        self._file.flush()
+
+    def close(self):
+        """
+        Close the capture file.
+        """
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CaptureReader:
+    """
+    Reads OSC messages from a capture file written by :class:`CaptureWriter`.
+
+    The file is memory-mapped, and an index of each message's path, offset,
+    timestamp and source is built on first use and stored next to the
+    capture file.  The index is memory-mapped as well, and extended when
+    messages have been appended to the capture.  Filtered iteration only
+    decodes the matching messages.
+
+    .. note:: :class:`!CaptureReader` requires Python 3.
+
+    .. versionadded:: 0.11.0
+    """
+    def __init__(self, filename, index_filename=None):
+        """
+        CaptureReader(filename, index_filename=None)
+
+        Open a capture file for reading.
+
+        :param filename:
+            the capture file.
+        :param index_filename:
+            where to store the index.  Defaults to *filename* with an
+            ``.idx`` suffix.
+
+        :raises ValueError:
+            if the file is not a capture file.
+        """
+        self._index_map = None
+        self._views = []
+        self._file = open(filename, 'rb')
+        try:
+            self._map = _mmap.mmap(self._file.fileno(), 0,
+                                   access=_mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError("'%s' is not a capture file" % filename)
+        if self._map[:len(_CAPTURE_MAGIC)] != _CAPTURE_MAGIC:
+            self.close()
+            raise ValueError("'%s' is not a capture file" % filename)
+
+        if index_filename is None:
+            index_filename = filename + '.idx'
+        try:
+            self._mtime = _os.fstat(self._file.fileno()).st_mtime
+            self._update_index(index_filename)
+        except:
+            self.close()
+            raise
+
+    def _checksum(self, end):
+        m = self._map
+        head = len(_CAPTURE_MAGIC)
+        crc = _zlib.crc32(m[head:min(head + _INDEX_CHECK_SIZE, end)])
+        crc = _zlib.crc32(m[max(end - _INDEX_CHECK_SIZE, head):end], crc)
+        return crc & 0xffffffff
+
+    def _update_index(self, filename):
+        header = self._load_index(filename)
+        if header is not None:
+            size, mtime, indexed, checksum = header[:4]
+            if (indexed <= size <= len(self._map) and
+                    self._checksum(indexed) == checksum):
+                if size == len(self._map) and mtime == self._mtime:
+                    return
+                if size < len(self._map):
+                    # messages were appended since the index was written
+                    self._extend_index(filename, indexed)
+                    return
+            self._close_index()
+
+        # start from an empty index
+        self._paths = []
+        self._sources = []
+        self._offsets = _array.array('Q')
+        self._times = _array.array('d')
+        self._source_ids = _array.array('I')
+        self._by_path = _array.array('I')
+        self._path_starts = _array.array('I', [0])
+        self._sorted = True
+        self._extend_index(filename, len(_CAPTURE_MAGIC))
+
+    def _load_index(self, filename):
+        # map an existing index, and return its header
+        try:
+            with open(filename, 'rb') as f:
+                m = _mmap.mmap(f.fileno(), 0, access=_mmap.ACCESS_READ)
+        except (IOError, OSError, ValueError):
+            return None
+        try:
+            return self._map_index(m)
+        except (ValueError, TypeError, _struct.error):
+            # truncated or corrupt index, treat it like a missing one
+            return None
+
+    def _map_index(self, m):
+        if m[:len(_INDEX_MAGIC)] != _INDEX_MAGIC:
+            raise ValueError("invalid index")
+        pos = len(_INDEX_MAGIC)
+        header = _INDEX_HEADER.unpack_from(m, pos)
+        nrecords, npaths, nsources, is_sorted, little_endian = header[4:]
+        if little_endian != (_sys.byteorder == 'little'):
+            raise ValueError("index has a different byte order")
+        pos += _INDEX_HEADER.size
+
+        strings = []
+        for i in range(npaths + nsources):
+            n, = _INDEX_STRING.unpack_from(m, pos)
+            pos += _INDEX_STRING.size
+            strings.append(_decode(m[pos:pos + n]))
+            pos += n
+        pos += -pos % 8
+
+        # views of the arrays, without copying them
+        base = memoryview(m)
+        views = [base]
+        for typecode, n in (('Q', nrecords), ('d', nrecords), ('I', nrecords),
+                            ('I', nrecords), ('I', npaths + 1)):
+            end = pos + n * _struct.calcsize(typecode)
+            if end > len(m):
+                raise ValueError("truncated index")
+            views.append(base[pos:end].cast(typecode))
+            pos = end
+
+        self._index_map = m
+        self._views = views
+        self._paths = strings[:npaths]
+        self._sources = strings[npaths:]
+        (self._offsets, self._times, self._source_ids, self._by_path,
+         self._path_starts) = views[1:]
+        self._sorted = is_sorted
+        return header
+
+    def _close_index(self):
+        for v in reversed(self._views):
+            v.release()
+        self._views = []
+        if self._index_map is not None:
+            try:
+                self._index_map.close()
+            except BufferError:
+                # still in use by a messages() iterator, the map will be
+                # closed once that is gone
+                pass
+            self._index_map = None
+
+    def _extend_index(self, filename, pos):
+        # parse the messages starting at pos, and write a new index
+        # containing both the current index and these messages
+        m = self._map
+        size = len(m)
+        path_ids = dict((_encode(p), i) for i, p in enumerate(self._paths))
+        source_ids = dict((_encode(s), i) for i, s in enumerate(self._sources))
+        first = len(self._offsets)
+        offsets = _array.array('Q')
+        times = _array.array('d')
+        rec_path_ids = _array.array('I')
+        rec_source_ids = _array.array('I')
+        is_sorted = self._sorted
+        last = self._times[-1] if first else None
+
+        while pos + _CAPTURE_RECORD.size <= size:
+            n, t, urlsize = _CAPTURE_RECORD.unpack_from(m, pos)
+            start = pos + _CAPTURE_RECORD.size + urlsize
+            end = start + n
+            if end > size:
+                # incomplete record, the capture is still being written
+                break
+            url = m[pos + _CAPTURE_RECORD.size:start]
+            path = m[start:max(m.find(b'\0', start, end), start)]
+            if last is not None and t < last:
+                is_sorted = False
+            last = t
+            offsets.append(pos)
+            times.append(t)
+            rec_path_ids.append(path_ids.setdefault(path, len(path_ids)))
+            rec_source_ids.append(source_ids.setdefault(url, len(source_ids)))
+            pos = end
+
+        if not offsets and self._index_map is not None:
+            # nothing new, keep using the current index
+            return
+
+        # group the new record numbers by path, keeping them in
+        # chronological order
+        counts = [0] * len(path_ids)
+        for i in rec_path_ids:
+            counts[i] += 1
+        starts = [0]
+        for c in counts:
+            starts.append(starts[-1] + c)
+        fill = starts[:-1]
+        by_path = _array.array('I', [0]) * len(rec_path_ids)
+        for r, i in enumerate(rec_path_ids):
+            by_path[fill[i]] = first + r
+            fill[i] += 1
+
+        # each path's records come after those already in the index
+        old_starts = self._path_starts
+        npaths = len(self._paths)
+        path_starts = _array.array('I', [0])
+        for i, c in enumerate(counts):
+            if i < npaths:
+                c += old_starts[i + 1] - old_starts[i]
+            path_starts.append(path_starts[-1] + c)
+
+        paths = self._paths + [_decode(p) for p in
+                               sorted(path_ids, key=path_ids.get)[npaths:]]
+        sources = self._sources + [
+            _decode(s) for s in
+            sorted(source_ids, key=source_ids.get)[len(self._sources):]]
+
+        def write(f):
+            f.write(_INDEX_MAGIC)
+            f.write(_INDEX_HEADER.pack(size, self._mtime, pos,
+                                       self._checksum(pos),
+                                       first + len(offsets), len(paths),
+                                       len(sources), is_sorted,
+                                       _sys.byteorder == 'little'))
+            for s in paths + sources:
+                s = _encode(s)
+                f.write(_INDEX_STRING.pack(len(s)))
+                f.write(s)
+            f.write(b'\0' * (-f.tell() % 8))
+            f.write(self._offsets)
+            f.write(offsets)
+            f.write(self._times)
+            f.write(times)
+            f.write(self._source_ids)
+            f.write(rec_source_ids)
+            for i in range(len(paths)):
+                if i < npaths:
+                    f.write(self._by_path[old_starts[i]:old_starts[i + 1]])
+                f.write(by_path[starts[i]:starts[i + 1]])
+            f.write(path_starts)
+
+        tmp_filename = filename + '.tmp'
+        try:
+            with open(tmp_filename, 'w+b') as f:
+                write(f)
+                f.flush()
+                index_map = _mmap.mmap(f.fileno(), 0,
+                                       access=_mmap.ACCESS_READ)
+        except (IOError, OSError):
+            # the index is only a cache, so carry on with a temporary one
+            try:
+                _os.remove(tmp_filename)
+            except OSError:
+                pass
+            filename = None
+            with _tempfile.TemporaryFile() as f:
+                write(f)
+                f.flush()
+                index_map = _mmap.mmap(f.fileno(), 0,
+                                       access=_mmap.ACCESS_READ)
+
+        self._close_index()
+        self._map_index(index_map)
+        if filename is not None:
+            try:
+                _os.replace(tmp_filename, filename)
+            except OSError:
+                pass
+
+    def _read(self, r):
+        pos = self._offsets[r]
+        n, t, urlsize = _CAPTURE_RECORD.unpack_from(self._map, pos)
+        start = pos + _CAPTURE_RECORD.size + urlsize
+        path, types, args = _deserialise_message(self._map[start:start + n])
+        src = self._sources[self._source_ids[r]] or None
+        return (path, types, args, src, t)
+
+    def messages(self, path=None, start=None, end=None, src=None):
+        """
+        messages(path=None, start=None, end=None, src=None)
+
+        Iterate over the messages matching all of the given criteria, in
+        the order in which they were written.  Each message is returned as a
+        ``(path, types, args, src, timestamp)`` tuple, with arguments
+        converted as they would be for a server callback, and *src* being
+        the source URL (or ``None`` if unknown).
+
+        :param path:
+            an OSC address pattern matching the paths of the messages to be
+            returned, e.g. ``'/mixer/*/fader'``.
+        :param start:
+            only return messages received at or after this time.
+        :param end:
+            only return messages received at or before this time.
+        :param src:
+            only return messages received from this :class:`Address` or URL.
+        """
+        times = self._times
+        first = 0
+        last = len(times)
+        if self._sorted:
+            # records are usually written as messages arrive, so the time
+            # range can be found by bisection
+            if start is not None:
+                first = _bisect.bisect_left(times, start)
+            if end is not None:
+                last = _bisect.bisect_right(times, end)
+
+        if path is None:
+            records = range(first, last)
+        else:
+            p = _encode(path)
+            slices = []
+            for i, candidate in enumerate(self._paths):
+                c = _encode(candidate)
+                if not lo_pattern_match(c, p):
+                    continue
+                lo = self._path_starts[i]
+                hi = self._path_starts[i + 1]
+                by_path = self._by_path
+                slices.append(by_path[_bisect.bisect_left(by_path, first, lo, hi):
+                                      _bisect.bisect_left(by_path, last, lo, hi)])
+            records = _heapq.merge(*slices)
+
+        if not self._sorted and (start is not None or end is not None):
+            records = (r for r in records
+                       if (start is None or times[r] >= start) and
+                          (end is None or times[r] <= end))
+
+        if src is not None:
+            if isinstance(src, Address):
+                src = src.url
+            source_id = (self._sources.index(src) if src in self._sources
+                         else None)
+            source_ids = self._source_ids
+            records = (r for r in records if source_ids[r] == source_id)
+
+        for r in records:
+            yield self._read(r)
+
+    def __iter__(self):
+        return self.messages()
+
+    def __len__(self):
+        return len(self._offsets)
+
+    @property
+    def paths(self):
+        """
+        A list of all distinct message paths in the capture.
+        """
+        return list(self._paths)
+
+    @property
+    def sources(self):
+        """
+        A list of all distinct source URLs in the capture.
+        """
+        return [s for s in self._sources if s]
+
+    def close(self):
+        """
+        Close the capture file.
+        """
+        self._close_index()
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -15,6 +15,9 @@ import unittest
 import re
 import time
 import sys
+import os
+import shutil
+import tempfile
 import functools
 import liblo
 
@@ -174,6 +177,162 @@ class ServerTestCase(ServerTestCaseBase):
         t2 = time.time()
         self.assertLess(t2 - t1, 0.01)
 
+    def testRecvBatch(self):
+        self.server.send(1234, '/foo', 123)
+        self.server.send(1234, '/bar', 'blubb', 4.5)
+        self.server.send(1234, liblo.Bundle(42.0, liblo.Message('/baz')))
+        records = self.server.recv_batch(timeout=100)
+        self.assertEqual(len(records), 3)
+        path, types, args, src, timetag = records[0]
+        self.assertEqual((path, types, args, timetag), ('/foo', 'i', [123], None))
+        self.assertTrue(matchHost(src.url, 'osc\.udp://.*:1234/'))
+        self.assertEqual(records[1][:3], ('/bar', 'sf', ['blubb', 4.5]))
+        self.assertEqual(records[2][0], '/baz')
+        self.assertAlmostEqual(records[2][4], 42.0)
+        self.assertEqual(self.server.recv_batch(timeout=0), [])
+
+    def testRecvBatchLimit(self):
+        for i in range(5):
+            self.server.send(1234, '/foo', i)
+        self.assertEqual([r[2][0] for r in self.server.recv_batch(3, 100)], [0, 1, 2])
+        self.assertEqual([r[2][0] for r in self.server.recv_batch(3, 100)], [3, 4])
+
+    def testRecvBatchInvalidLimit(self):
+        self.server.send(1234, '/foo', 1)
+        self.assertRaises(ValueError, self.server.recv_batch, 0, 100)
+        self.assertRaises(ValueError, self.server.recv_batch, -1, 100)
+        # nothing was received
+        self.assertEqual(len(self.server.recv_batch(timeout=100)), 1)
+
+    def testRecvBatchMethods(self):
+        self.server.add_method('/foo', 'i', self.callback)
+        self.server.send(1234, '/foo', 123)
+        self.server.send(1234, '/bar', 456)
+        records = self.server.recv_batch(timeout=100)
+        self.assertEqual([r[0] for r in records], ['/bar'])
+        self.assertEqual(self.cb.args[0], 123)
+        # methods added later still receive messages outside of recv_batch()
+        self.server.add_method('/bar', 'i', self.callback)
+        self.server.send(1234, '/bar', 789)
+        self.assertTrue(self.server.recv())
+        self.assertEqual(self.cb.path, '/bar')
+        self.assertEqual(self.cb.args[0], 789)
+
+    def testRecvBatchAddMethod(self):
+        self.server.send(1234, '/foo', 1)
+        self.assertEqual(len(self.server.recv_batch(timeout=100)), 1)
+        # methods added after recv_batch() take precedence in later batches
+        self.server.add_method('/x', 'i', self.callback)
+        self.server.send(1234, '/x', 2)
+        self.server.send(1234, '/foo', 3)
+        records = self.server.recv_batch(timeout=100)
+        self.assertEqual([r[0] for r in records], ['/foo'])
+        self.assertEqual(self.cb.path, '/x')
+        self.assertEqual(self.cb.args[0], 2)
+
+    def testRecvBatchHandledLimit(self):
+        self.server.add_method('/foo', 'i', self.callback)
+        for i in range(5):
+            self.server.send(1234, '/foo', i)
+        self.assertEqual(self.server.recv_batch(3, 100), [])
+        self.assertEqual(self.cb.args[0], 2)
+
+    def testCoalesce(self):
+        calls = []
+        def fader(path, args):
+            calls.append((path, args[0]))
+        def button(path, args):
+            calls.append((path, None))
+        self.server.add_method('/fader', 'i', fader, coalesce=True)
+        self.server.add_method('/button', None, button)
+        self.server.send(1234, '/fader', 1)
+        self.server.send(1234, '/button')
+        for i in range(2, 6):
+            self.server.send(1234, '/fader', i)
+        while self.server.recv(0):
+            pass
+        self.assertEqual(calls, [('/button', None), ('/fader', 5)])
+        self.assertEqual(self.server.coalesced, 4)
+
+    def testCoalesceInterleaved(self):
+        calls = []
+        def fader(path, args):
+            calls.append((path, args[0]))
+        self.server.add_method('/fader/1', 'i', fader, coalesce=True)
+        self.server.add_method('/fader/2', 'i', fader, coalesce=True)
+        for i in range(50):
+            self.server.send(1234, '/fader/1', i)
+            self.server.send(1234, '/fader/2', i)
+        self.assertTrue(self.server.recv())
+        self.assertEqual(calls, [('/fader/1', 49), ('/fader/2', 49)])
+        self.assertEqual(self.server.coalesced, 98)
+
+    def testCoalesceUnhandled(self):
+        calls = []
+        self.server.add_method('/fader', 'i', lambda path, args: calls.append(args[0]),
+                               coalesce=True)
+        self.server.send(1234, '/fader', 1)
+        self.server.send(1234, '/unhandled', 2)
+        self.assertTrue(self.server.recv())
+        self.assertEqual(calls, [1])
+
+    def testCoalesceDelMethod(self):
+        calls = []
+        self.server.add_method('/fader', 'i', lambda path, args: calls.append(args[0]),
+                               coalesce=True)
+        self.server.add_method('/remove', None,
+                               lambda: self.server.del_method('/fader', 'i'))
+        self.server.send(1234, '/fader', 1)
+        self.server.send(1234, '/remove')
+        self.server.send(1234, '/unhandled')
+        self.assertTrue(self.server.recv())
+        self.assertEqual(calls, [])
+
+    def testCoalesceRecvBatch(self):
+        self.server.add_method('/fader', 'i', self.callback, coalesce=True)
+        for i in range(3):
+            self.server.send(1234, '/fader', i)
+        self.server.send(1234, '/foo')
+        self.assertEqual([r[0] for r in self.server.recv_batch(timeout=100)], ['/foo'])
+        self.assertEqual(self.cb.args[0], 2)
+        self.assertEqual(self.server.coalesced, 2)
+
+    def testCoalesceException(self):
+        def fader(path, args):
+            raise RuntimeError("blubb")
+        self.server.add_method('/fader', 'i', fader, coalesce=True)
+        self.server.send(1234, '/fader', 1)
+        self.assertTrue(self.server.recv())
+
+    def testCoalesceProfiling(self):
+        self.server.add_method('/fader', 'i', self.callback, coalesce=True)
+        self.server.enable_profiling()
+        for i in range(3):
+            self.server.send(1234, '/fader', i)
+        while self.server.recv(0):
+            pass
+        profile = self.server.get_profile()
+        self.assertEqual(profile['/fader']['decode']['count'], 3)
+        self.assertEqual(profile['/fader']['handler']['count'], 1)
+        self.assertEqual(self.cb.args[0], 2)
+
+    def testCoalesceBySource(self):
+        calls = []
+        def fader(path, args, types, src):
+            calls.append((src.port, args[0]))
+        self.server.add_method('/fader', 'i', fader, coalesce_by_src=True)
+        a = liblo.Server(1235)
+        b = liblo.Server(1236)
+        for i in range(3):
+            a.send(1234, '/fader', i)
+            b.send(1234, '/fader', 10 + i)
+        while self.server.recv(0):
+            pass
+        self.assertEqual(sorted(calls), [(1235, 2), (1236, 12)])
+        self.assertEqual(self.server.coalesced, 4)
+        a.free()
+        b.free()
+
     def testMethodAfterFree(self):
         self.server.free()
         with self.assertRaises(RuntimeError):
@@ -234,6 +393,33 @@ class ServerTestCase(ServerTestCaseBase):
         self.testSendBundle()
         self.assertEqual(bundle_data, ['start', 'end'])
 
+    def testProfiling(self):
+        timings = []
+        self.server.add_method('/foo', 'i', self.callback)
+        self.server.send(1234, '/foo', 123)
+        self.assertTrue(self.server.recv())
+        self.assertEqual(self.server.get_profile(), {})
+
+        self.server.enable_profiling(lambda path, t: timings.append((path, t)))
+        self.server.send(1234, '/foo', 123)
+        self.server.send(1234, '/foo', 456)
+        self.assertTrue(self.server.recv())
+        self.assertTrue(self.server.recv())
+        self.server.disable_profiling()
+        self.server.send(1234, '/foo', 789)
+        self.assertTrue(self.server.recv())
+
+        self.assertEqual(len(timings), 2)
+        self.assertEqual(timings[0][0], '/foo')
+        profile = self.server.get_profile(reset=True)
+        self.assertEqual(list(profile), ['/foo'])
+        self.assertEqual(sorted(profile['/foo']),
+                         ['decode', 'handler', 'resolve', 'source'])
+        for stage in profile['/foo'].values():
+            self.assertEqual(stage['count'], 2)
+            self.assertGreaterEqual(stage['total'], stage['max'])
+        self.assertEqual(self.server.get_profile(), {})
+
 
 class ServerCreationTestCase(unittest.TestCase):
     def testNoPermission(self):
@@ -294,6 +480,113 @@ class ServerThreadTestCase(ServerTestCaseBase):
         self.server.stop()
         self.assertEqual(self.cb.args[0], 42)
 
+    def testCoalesceUnhandled(self):
+        self.server.add_method('/fader', 'i', self.callback, coalesce=True)
+        self.server.send('1234', '/fader', 42)
+        self.server.send('1234', '/unhandled', 23)
+        self.server.start()
+        time.sleep(0.2)
+        self.server.stop()
+        self.assertEqual(self.cb.args[0], 42)
+
+    def testCoalesceInterleaved(self):
+        calls = []
+        def fader(path, args):
+            calls.append((path, args[0]))
+        self.server.add_method('/fader/1', 'i', fader, coalesce=True)
+        self.server.add_method('/fader/2', 'i', fader, coalesce=True)
+        for i in range(10):
+            self.server.send('1234', '/fader/1', i)
+            self.server.send('1234', '/fader/2', i)
+        self.server.start()
+        time.sleep(0.2)
+        self.server.stop()
+        self.assertEqual(calls, [('/fader/1', 9), ('/fader/2', 9)])
+        self.assertEqual(self.server.coalesced, 18)
+
+    def testCoalesceDelAllMethods(self):
+        self.server.add_method('/fader', 'i', self.callback, coalesce=True)
+        self.server.add_method(None, None, lambda: None)
+        self.server.del_method(None, None)
+        self.server.send('1234', '/fader', 42)
+        self.server.send('1234', '/unhandled')
+        self.server.start()
+        time.sleep(0.2)
+        self.server.stop()
+        self.assertEqual(self.cb.args[0], 42)
+
+
+class MulticastTestCase(ServerTestCaseBase):
+    group = '239.255.0.42'
+
+    def setUp(self):
+        ServerTestCaseBase.setUp(self)
+        self.server = liblo.Server('1234', group=self.group)
+
+    def tearDown(self):
+        del self.server
+
+    def testSendReceive(self):
+        self.server.add_method('/foo', 'i', self.callback)
+        liblo.send((self.group, 1234), '/foo', 123)
+        self.assertTrue(self.server.recv(1000))
+        self.assertEqual(self.cb.path, '/foo')
+        self.assertEqual(self.cb.args[0], 123)
+
+    def testTTL(self):
+        a = liblo.Address(self.group, 1234)
+        self.assertEqual(a.ttl, -1)
+        a.ttl = 2
+        self.assertEqual(a.ttl, 2)
+        self.server.add_method('/foo', 'i', self.callback)
+        liblo.send(a, '/foo', 42)
+        self.assertTrue(self.server.recv(1000))
+        self.assertEqual(self.cb.args[0], 42)
+
+    def testMulticastOptions(self):
+        sender = liblo.Server()
+        self.server.add_method('/foo', 'i', self.callback)
+        sender.set_multicast_options(ttl=1, loopback=True)
+        sender.send((self.group, 1234), '/foo', 23)
+        self.assertTrue(self.server.recv(1000))
+        self.assertEqual(self.cb.args[0], 23)
+        sender.set_multicast_options(loopback=False)
+        sender.send((self.group, 1234), '/foo', 42)
+        self.assertFalse(self.server.recv(200))
+        sender.free()
+
+    def testServerThread(self):
+        server = liblo.ServerThread('1235', group=self.group)
+        server.add_method('/foo', 'i', self.callback)
+        server.start()
+        liblo.send((self.group, 1235), '/foo', 42)
+        time.sleep(0.2)
+        server.stop()
+        server.free()
+        self.assertEqual(self.cb.args[0], 42)
+
+    def testTCP(self):
+        with self.assertRaises(ValueError):
+            liblo.Server('1235', liblo.TCP, group=self.group)
+
+    def testInvalidInterface(self):
+        with self.assertRaises(liblo.ServerError):
+            liblo.Server('1235', group=self.group, iface='nonexistent0')
+        with self.assertRaises(liblo.ServerError):
+            liblo.ServerThread('1235', group=self.group, iface='nonexistent0')
+
+    def testInterfaceWithoutGroup(self):
+        with self.assertRaises(ValueError):
+            liblo.Server('1235', iface='lo')
+        with self.assertRaises(ValueError):
+            liblo.ServerThread('1235', ip='127.0.0.1')
+
+    def testMulticastOptionsTCP(self):
+        server = liblo.Server('1235', liblo.TCP)
+        with self.assertRaises(ValueError):
+            server.set_multicast_options(ttl=2)
+        server.free()
+
 
 class DecoratorTestCase(unittest.TestCase):
     class TestServer(liblo.Server):
@@ -304,6 +597,10 @@ class DecoratorTestCase(unittest.TestCase):
         def foo_cb(self, path, args, types, src, data):
             self.cb = Arguments(path, args, types, src, data)
 
+        @liblo.make_method('/fader', 'i', coalesce=True)
+        def fader_cb(self, path, args):
+            self.fader = args[0]
+
     def setUp(self):
         self.server = self.TestServer()
 
@@ -316,6 +613,44 @@ class DecoratorTestCase(unittest.TestCase):
         self.assertEqual(self.server.cb.path, '/foo')
         self.assertEqual(len(self.server.cb.args), 3)
 
+    def testCoalesce(self):
+        for i in range(3):
+            liblo.send(1234, '/fader', i)
+        while self.server.recv(0):
+            pass
+        self.assertEqual(self.server.fader, 2)
+        self.assertEqual(self.server.coalesced, 2)
+
+    def testMultipleInstances(self):
+        # the second instance uses the cached registry
+        self.server.free()
+        for i in range(2):
+            server = self.TestServer()
+            liblo.send(1234, '/foo', i, ('b', [1]), ('m', (0, 0, 0, 0)))
+            self.assertTrue(server.recv())
+            self.assertEqual(server.cb.args[0], i)
+            server.free()
+
+    def testOrderAndProperties(self):
+        class Handler:
+            def __init__(self):
+                self.calls = []
+            @property
+            def broken(self):
+                raise RuntimeError("property evaluated")
+            @liblo.make_method('/bar', 'i')
+            def b_first(self, path, args):
+                self.calls.append('first')
+                return 1
+            @liblo.make_method('/bar', 'i')
+            def a_second(self, path, args, types):
+                self.calls.append('second')
+        h = Handler()
+        self.server.register_methods(h)
+        liblo.send(1234, '/bar', 1)
+        self.assertTrue(self.server.recv())
+        self.assertEqual(h.calls, ['first', 'second'])
+
 
 class AddressTestCase(unittest.TestCase):
     def testPort(self):
@@ -341,5 +676,135 @@ class AddressTestCase(unittest.TestCase):
         self.assertEqual(a.url, 'osc.tcp://foo:1234/')
 
 
+class CaptureTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, 'test.cap')
+        with liblo.CaptureWriter(self.filename) as w:
+            w.write(liblo.Message('/foo', 1), 'osc.udp://foo:1234/', 10.0)
+            w.write(liblo.Message('/bar', 'blubb'), 'osc.udp://bar:1234/', 11.0)
+            w.write(liblo.Message('/foo', 2, 0.5), 'osc.udp://bar:1234/', 12.0)
+            w.write(liblo.Message('/baz/1'), None, 13.0)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def testReadAll(self):
+        with liblo.CaptureReader(self.filename) as r:
+            self.assertEqual(len(r), 4)
+            self.assertEqual(sorted(r.paths), ['/bar', '/baz/1', '/foo'])
+            m = list(r)
+        self.assertEqual(m[0], ('/foo', 'i', [1], 'osc.udp://foo:1234/', 10.0))
+        self.assertEqual(m[1], ('/bar', 's', ['blubb'], 'osc.udp://bar:1234/', 11.0))
+        self.assertEqual(m[2], ('/foo', 'if', [2, 0.5], 'osc.udp://bar:1234/', 12.0))
+        self.assertEqual(m[3], ('/baz/1', '', [], None, 13.0))
+
+    def testFilterPath(self):
+        with liblo.CaptureReader(self.filename) as r:
+            self.assertEqual([m[2] for m in r.messages('/foo')], [[1], [2, 0.5]])
+            self.assertEqual([m[0] for m in r.messages('/ba?')], ['/bar'])
+            self.assertEqual([m[0] for m in r.messages('/ba*/*')], ['/baz/1'])
+            self.assertEqual(list(r.messages('/blah')), [])
+
+    def testFilterTime(self):
+        with liblo.CaptureReader(self.filename) as r:
+            self.assertEqual([m[4] for m in r.messages(start=11.0, end=12.0)],
+                             [11.0, 12.0])
+            self.assertEqual([m[4] for m in r.messages('/foo', start=11.5)],
+                             [12.0])
+
+    def testFilterSource(self):
+        with liblo.CaptureReader(self.filename) as r:
+            self.assertEqual([m[0] for m in r.messages(src='osc.udp://bar:1234/')],
+                             ['/bar', '/foo'])
+            self.assertEqual([m[0] for m in r.messages('/foo', src='osc.udp://bar:1234/')],
+                             ['/foo'])
+
+    def testIndex(self):
+        liblo.CaptureReader(self.filename).close()
+        self.assertTrue(os.path.exists(self.filename + '.idx'))
+        with liblo.CaptureReader(self.filename) as r:
+            self.assertEqual(len(list(r.messages('/foo'))), 2)
+        # appended messages are added to the index
+        with liblo.CaptureWriter(self.filename, append=True) as w:
+            w.write(liblo.Message('/foo', 3), None, 14.0)
+        with liblo.CaptureReader(self.filename) as r:
+            self.assertEqual(len(list(r.messages('/foo'))), 3)
+
+    def testIndexExtended(self):
+        liblo.CaptureReader(self.filename).close()
+        with liblo.CaptureWriter(self.filename, append=True) as w:
+            w.write(liblo.Message('/new', 3), 'osc.udp://new:1234/', 14.0)
+            w.write(liblo.Message('/foo', 4), 'osc.udp://new:1234/', 10.5)
+        with liblo.CaptureReader(self.filename) as r:
+            self.assertEqual(len(r), 6)
+            self.assertEqual(sorted(r.paths), ['/bar', '/baz/1', '/foo', '/new'])
+            self.assertEqual([m[2] for m in r.messages('/foo')], [[1], [2, 0.5], [4]])
+            self.assertEqual([m[0] for m in r.messages(src='osc.udp://new:1234/')],
+                             ['/new', '/foo'])
+            self.assertEqual([m[4] for m in r.messages(start=10.5, end=12.0)],
+                             [11.0, 12.0, 10.5])
+        # the extended index is used as is
+        with liblo.CaptureReader(self.filename) as r:
+            self.assertEqual([m[0] for m in r.messages('/n*')], ['/new'])
+
+    def testCloseWhileIterating(self):
+        r = liblo.CaptureReader(self.filename)
+        messages = r.messages('/foo')
+        next(messages)
+        r.close()
+
+    def testIndexRewritten(self):
+        liblo.CaptureReader(self.filename).close()
+        # same paths and types, so the file size doesn't change
+        with liblo.CaptureWriter(self.filename) as w:
+            w.write(liblo.Message('/foo', 7), 'osc.udp://foo:1234/', 20.0)
+            w.write(liblo.Message('/bar', 'abcde'), 'osc.udp://bar:1234/', 21.0)
+            w.write(liblo.Message('/foo', 8, 1.5), 'osc.udp://bar:1234/', 22.0)
+            w.write(liblo.Message('/baz/1'), None, 23.0)
+        # make sure the modification time differs, regardless of the
+        # file system's timestamp resolution
+        st = os.stat(self.filename)
+        os.utime(self.filename, (st.st_atime, st.st_mtime + 10))
+        with liblo.CaptureReader(self.filename) as r:
+            self.assertEqual([m[4] for m in r.messages(start=20.0, end=21.0)],
+                             [20.0, 21.0])
+
+    def testIndexCorrupt(self):
+        liblo.CaptureReader(self.filename).close()
+        with open(self.filename + '.idx', 'r+b') as f:
+            f.truncate(20)
+        with liblo.CaptureReader(self.filename) as r:
+            self.assertEqual(len(list(r.messages('/foo'))), 2)
+
+    def testUnsortedTimestamps(self):
+        with liblo.CaptureWriter(self.filename, append=True) as w:
+            w.write(liblo.Message('/foo', 3), None, 10.5)
+        with liblo.CaptureReader(self.filename) as r:
+            self.assertEqual([m[4] for m in r.messages(start=10.5, end=12.0)],
+                             [11.0, 12.0, 10.5])
+            self.assertEqual([m[2] for m in r.messages('/foo', end=10.5)],
+                             [[1], [3]])
+
+    def testNotACapture(self):
+        with open(self.filename, 'wb') as f:
+            f.write(b'blah')
+        with self.assertRaises(ValueError):
+            liblo.CaptureReader(self.filename)
+
+    def testCaptureServer(self):
+        server = liblo.Server(1234)
+        with liblo.CaptureWriter(self.filename) as w:
+            server.add_method(None, None, w)
+            server.send(1234, '/foo', 42, 'bar')
+            self.assertTrue(server.recv())
+        server.free()
+        with liblo.CaptureReader(self.filename) as r:
+            m = list(r)
+        self.assertEqual(len(m), 1)
+        self.assertEqual(m[0][:3], ('/foo', 'is', [42, 'bar']))
+        self.assertTrue(matchHost(m[0][3], 'osc\.udp://.*:1234/'))
+
+
 if __name__ == "__main__":
     unittest.main()